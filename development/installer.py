@@ -2,51 +2,144 @@
 import argparse
 import os
 import subprocess
-import requests
+import sys
+import time
 import json
 
+# asyncio, collections and urllib are only imported inside the
+# functions that need them, keeping startup lean for short control
+# paths like --list-branches.
 
-def cprint(*args, level: int = 1):
+# Cache of branch listings keyed by repo_url so repeated lookups within a
+# single run (e.g. --list-branches followed by validate_branch) skip the
+# network round trip. Entries expire after _BRANCH_CACHE_TTL seconds.
+_BRANCH_CACHE = {}
+_BRANCH_CACHE_TTL = 300
+
+# On-disk cache of the last branch listing per repo along with the ETag /
+# Last-Modified headers GitHub returned for it. Lets us issue conditional
+# GETs: a 304 Not Modified response has no body and barely touches the
+# rate limit.
+_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "frappe_installer")
+_BRANCH_CACHE_FILE = os.path.join(_CACHE_DIR, "branches.json")
+
+
+def _read_branch_cache_file():
+    try:
+        with open(_BRANCH_CACHE_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_branch_cache_file(cache):
+    try:
+        os.makedirs(_CACHE_DIR, exist_ok=True)
+        with open(_BRANCH_CACHE_FILE, "w") as f:
+            json.dump(cache, f)
+    except OSError:
+        pass
+
+
+_COLORS = {
+    1: "\033[31m",  # RED
+    2: "\33[92m",  # GREEN
+    3: "\33[93m",  # YELLOW
+}
+_RESET = "\033[0m"
+
+# Set from --verbose; level-3 diagnostics are skipped entirely when off
+VERBOSE = False
+
+
+def cprint(fmt, *args, level: int = 1):
     """
     logs colorful messages
     level = 1 : RED
     level = 2 : GREEN
-    level = 3 : YELLOW
+    level = 3 : YELLOW (diagnostic, only shown with --verbose)
 
     default level = 1
+
+    Extra positional args are substituted lazily via str.format, so
+    suppressed diagnostics never pay for string formatting.
+    """
+    if level == 3 and not VERBOSE:
+        return
+    message = fmt.format(*args) if args else str(fmt)
+    if sys.stdout.isatty():
+        color = _COLORS.get(level, _COLORS[1])
+        sys.stdout.write(f"{color} {message} {_RESET}\n")  # noqa: T001, T201
+    else:
+        # No escape sequences when piped into CI logs or files
+        sys.stdout.write(f" {message} \n")  # noqa: T001, T201
+
+
+# Branches that already survived a successful bench init don't need to
+# be re-validated over the network for a day.
+_VALIDATED_CACHE_FILE = os.path.join(_CACHE_DIR, "validated.json")
+_VALIDATED_TTL = 24 * 60 * 60
+
+
+def _get_known_good_branches(repo_url):
+    try:
+        with open(_VALIDATED_CACHE_FILE) as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return []
+    entry = cache.get(repo_url)
+    if entry and time.time() - entry.get("ts", 0) < _VALIDATED_TTL:
+        return entry.get("known_good_branches", [])
+    return []
+
+
+def _record_known_good_branch(repo_url, branch):
+    try:
+        with open(_VALIDATED_CACHE_FILE) as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        cache = {}
+    entry = cache.setdefault(repo_url, {"known_good_branches": []})
+    if branch not in entry["known_good_branches"]:
+        entry["known_good_branches"].append(branch)
+    entry["ts"] = time.time()
+    try:
+        os.makedirs(_CACHE_DIR, exist_ok=True)
+        with open(_VALIDATED_CACHE_FILE, "w") as f:
+            json.dump(cache, f)
+    except OSError:
+        pass
+
+
+def _parse_branch_names(body):
     """
-    CRED = "\033[31m"
-    CGRN = "\33[92m"
-    CYLW = "\33[93m"
-    reset = "\033[0m"
-    message = " ".join(map(str, args))
-    if level == 1:
-        print(CRED, message, reset)  # noqa: T001, T201
-    if level == 2:
-        print(CGRN, message, reset)  # noqa: T001, T201
-    if level == 3:
-        print(CYLW, message, reset)  # noqa: T001, T201
+    Extract branch names from a /branches response body. Only the
+    "name" field is needed, so stream the body with ijson when it is
+    installed instead of materializing every branch dict; fall back to
+    the plain json parse otherwise.
+    """
+    try:
+        import ijson
+    except ImportError:
+        return [branch["name"] for branch in json.load(body)]
+    return [
+        value
+        for prefix, event, value in ijson.parse(body)
+        if event == "string" and prefix.endswith(".name")
+    ]
 
 
 def get_available_branches(repo_url):
     """
     Get available branches from a GitHub repository
     """
-    try:
-        # Extract owner and repo from GitHub URL
-        if repo_url.startswith("https://github.com/"):
-            parts = repo_url.replace("https://github.com/", "").split("/")
-            if len(parts) >= 2:
-                owner, repo = parts[0], parts[1]
-                api_url = f"https://api.github.com/repos/{owner}/{repo}/branches"
-                response = requests.get(api_url, timeout=10)
-                if response.status_code == 200:
-                    branches = [branch["name"] for branch in response.json()]
-                    return branches
-    except Exception as e:
-        cprint(f"Warning: Could not fetch branches from {repo_url}: {e}", level=3)
-    
-    # Fallback: try git ls-remote
+    cached = _BRANCH_CACHE.get(repo_url)
+    if cached and time.monotonic() - cached[0] < _BRANCH_CACHE_TTL:
+        return cached[1]
+
+    # Primary: a single `git ls-remote` returns every head in one round
+    # trip, is not paginated, and doesn't count against the GitHub API
+    # rate limit.
     try:
         result = subprocess.run(
             ["git", "ls-remote", "--heads", repo_url],
@@ -62,17 +155,136 @@ def get_available_branches(repo_url):
                     if len(parts) >= 2:
                         branch_name = parts[1].replace('refs/heads/', '')
                         branches.append(branch_name)
+            _BRANCH_CACHE[repo_url] = (time.monotonic(), branches)
             return branches
     except Exception as e:
         cprint(f"Warning: Could not fetch branches using git ls-remote: {e}", level=3)
-    
+
+    # Fallback: GitHub REST API, for hosts without a usable git binary
+    try:
+        import urllib.error
+        import urllib.request
+
+        # Extract owner and repo from GitHub URL
+        if repo_url.startswith("https://github.com/"):
+            parts = repo_url.replace("https://github.com/", "").split("/")
+            if len(parts) >= 2:
+                owner, repo = parts[0], parts[1]
+                api_url = f"https://api.github.com/repos/{owner}/{repo}/branches"
+                disk_cache = _read_branch_cache_file()
+                cached_entry = disk_cache.get(repo_url, {})
+                headers = {
+                    "Accept": "application/vnd.github+json",
+                    "X-GitHub-Api-Version": "2022-11-28",
+                }
+                # Authenticated calls get 5000 requests/hour instead of
+                # 60, which matters for CI loops hammering this path.
+                token = os.environ.get("GITHUB_TOKEN")
+                if token:
+                    headers["Authorization"] = f"Bearer {token}"
+                if cached_entry.get("etag"):
+                    headers["If-None-Match"] = cached_entry["etag"]
+                if cached_entry.get("last_modified"):
+                    headers["If-Modified-Since"] = cached_entry["last_modified"]
+                request = urllib.request.Request(api_url, headers=headers)
+                response = None
+                for attempt in range(3):
+                    try:
+                        response = urllib.request.urlopen(request, timeout=10)
+                        break
+                    except urllib.error.HTTPError as err:
+                        if err.code == 304 and cached_entry.get("branches"):
+                            branches = cached_entry["branches"]
+                            _BRANCH_CACHE[repo_url] = (
+                                time.monotonic(),
+                                branches,
+                            )
+                            return branches
+                        # Back off briefly on transient server-side /
+                        # rate-limit errors before giving up.
+                        if err.code in (429, 500, 502, 503, 504) and attempt < 2:
+                            time.sleep(0.5 * 2**attempt)
+                            continue
+                        raise
+                with response:
+                    remaining = response.headers.get("X-RateLimit-Remaining")
+                    if remaining and remaining.isdigit() and int(remaining) <= 5:
+                        reset = response.headers.get("X-RateLimit-Reset", "?")
+                        cprint(
+                            f"Warning: GitHub API rate limit nearly exhausted ({remaining} calls left, resets at epoch {reset})",  # noqa: E501
+                            level=3,
+                        )
+                    branches = _parse_branch_names(response)
+                disk_cache[repo_url] = {
+                    "etag": response.headers.get("ETag"),
+                    "last_modified": response.headers.get("Last-Modified"),
+                    "branches": branches,
+                }
+                _write_branch_cache_file(disk_cache)
+                _BRANCH_CACHE[repo_url] = (time.monotonic(), branches)
+                return branches
+    except Exception as e:
+        cprint(f"Warning: Could not fetch branches from {repo_url}: {e}", level=3)
+
     return []
 
 
+def _branch_point_check(repo_url, branch):
+    """
+    Point-check one branch via GET /branches/{branch}: a single ~1KB
+    request instead of the full (paginated) listing, which also avoids
+    the REST path's 30-entries-per-page blind spot. Returns True/False
+    on a definitive 200/404 and None when the check cannot decide.
+    """
+    if not repo_url.startswith("https://github.com/"):
+        return None
+    parts = repo_url.replace("https://github.com/", "").split("/")
+    if len(parts) < 2:
+        return None
+
+    import urllib.error
+    import urllib.request
+
+    owner, repo = parts[0], parts[1]
+    api_url = f"https://api.github.com/repos/{owner}/{repo}/branches/{branch}"
+    headers = {
+        "Accept": "application/vnd.github+json",
+        "X-GitHub-Api-Version": "2022-11-28",
+    }
+    token = os.environ.get("GITHUB_TOKEN")
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    try:
+        with urllib.request.urlopen(
+            urllib.request.Request(api_url, headers=headers), timeout=5
+        ):
+            return True
+    except urllib.error.HTTPError as err:
+        if err.code == 404:
+            return False
+        return None
+    except Exception:
+        return None
+
+
 def validate_branch(repo_url, branch):
     """
     Validate if a branch exists in the repository
     """
+    # Fast path: a branch that recently passed a full bench init is
+    # known good, so skip the network lookup entirely. bench itself
+    # still reports InvalidRemoteException if the remote changed.
+    if branch in _get_known_good_branches(repo_url):
+        return True
+
+    exists = _branch_point_check(repo_url, branch)
+    if exists is True:
+        return True
+    if exists is False:
+        cprint(f"Error: Branch '{branch}' not found in repository {repo_url}", level=1)
+        cprint("Use --list-branches to see available branches.", level=1)
+        return False
+
     available_branches = get_available_branches(repo_url)
     if available_branches:
         if branch in available_branches:
@@ -87,9 +299,12 @@ def validate_branch(repo_url, branch):
 
 
 def main():
+    global VERBOSE
+
     parser = get_args_parser()
     args = parser.parse_args()
-    
+    VERBOSE = args.verbose
+
     # Validate branch before proceeding
     if not validate_branch(args.frappe_repo, args.frappe_branch):
         cprint("Please specify a valid branch using --frappe-branch", level=1)
@@ -179,6 +394,11 @@ def get_args_parser():
         help="Database type to use (e.g., mariadb or postgres)",
         default="postgres",  # Changed default to postgres
     )
+    parser.add_argument(
+        "--shallow",
+        action="store_true",
+        help="Shallow-clone frappe and apps during bench init to save bandwidth and disk",  # noqa: E501
+    )
     parser.add_argument(
         "--list-branches",
         action="store_true",
@@ -187,108 +407,157 @@ def get_args_parser():
     return parser
 
 
+def _shallow_git_shim():
+    """
+    Create a directory holding a `git` wrapper that forces
+    --depth=1 --single-branch --no-tags onto every clone. Prepended to
+    PATH during bench init, it keeps bench from downloading the full
+    multi-branch Frappe history (often 10-100x the bytes actually
+    needed).
+    """
+    import shutil
+    import tempfile
+
+    real_git = shutil.which("git") or "git"
+    shim_dir = tempfile.mkdtemp(prefix="frappe-installer-git-")
+    shim_path = os.path.join(shim_dir, "git")
+    with open(shim_path, "w") as f:
+        f.write(
+            "#!/bin/sh\n"
+            f'real_git="{real_git}"\n'
+            'if [ "$1" = "clone" ]; then\n'
+            "    shift\n"
+            '    exec "$real_git" clone --depth=1 --single-branch --no-tags "$@"\n'  # noqa: E501
+            "fi\n"
+            'exec "$real_git" "$@"\n'
+        )
+    os.chmod(shim_path, 0o755)
+    return shim_dir
+
+
 def init_bench_if_not_exist(args):
     if os.path.exists(args.bench_name):
         cprint("Bench already exists. Only site will be created", level=3)
         return
-    
+
+    import collections
+
     try:
         env = os.environ.copy()
         if args.py_version:
             env["PYENV_VERSION"] = args.py_version
+        if args.shallow:
+            env["PATH"] = _shallow_git_shim() + os.pathsep + env.get("PATH", "")
         
-        init_command = ""
-        if args.node_version:
-            init_command = f"nvm use {args.node_version};"
-        if args.py_version:
-            init_command += f"PYENV_VERSION={args.py_version} "
-        init_command += "bench init "
-        init_command += "--skip-redis-config-generation "
-        init_command += "--verbose " if args.verbose else " "
-        init_command += f"--frappe-path={args.frappe_repo} "
-        init_command += f"--frappe-branch={args.frappe_branch} "
-        init_command += f"--apps_path={args.apps_json} "
-        init_command += args.bench_name
-        
-        cprint(f"Initializing bench with Frappe branch: {args.frappe_branch}", level=2)
-        
-        command = [
-            "/bin/bash",
-            "-i",
-            "-c",
-            init_command,
+        bench_command = [
+            "bench",
+            "init",
+            "--skip-redis-config-generation",
         ]
-        
-        result = subprocess.run(command, env=env, cwd=os.getcwd(), capture_output=True, text=True)
-        
-        if result.returncode != 0:
+        if args.verbose:
+            bench_command.append("--verbose")
+        bench_command += [
+            f"--frappe-path={args.frappe_repo}",
+            f"--frappe-branch={args.frappe_branch}",
+            f"--apps_path={args.apps_json}",
+            args.bench_name,
+        ]
+
+        cprint(f"Initializing bench with Frappe branch: {args.frappe_branch}", level=2)
+
+        if args.node_version:
+            # nvm is a shell function, so it still needs bash, but
+            # sourcing nvm.sh alone is far cheaper than an interactive
+            # shell (-i) that loads ~/.bashrc, readline and completion
+            # scripts before bench even starts.
+            nvm_dir = env.get("NVM_DIR", os.path.expanduser("~/.nvm"))
+            command = [
+                "/bin/bash",
+                "-c",
+                f'source "{nvm_dir}/nvm.sh" && nvm use {args.node_version} && exec "$@"',  # noqa: E501
+                "bash",
+            ] + bench_command
+        else:
+            command = bench_command
+
+
+        # Stream output line by line instead of buffering megabytes of
+        # pip/npm logs in memory until completion; keep only a short
+        # tail around for error diagnosis.
+        proc = subprocess.Popen(
+            command,
+            env=env,
+            cwd=os.getcwd(),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            bufsize=1,
+        )
+        output_tail = collections.deque(maxlen=200)
+        for line in proc.stdout:
+            print(line, end="")  # noqa: T001, T201
+            output_tail.append(line)
+        returncode = proc.wait()
+
+        if returncode != 0:
+            tail = "".join(output_tail)
             cprint("Error during bench initialization:", level=1)
-            cprint(result.stderr, level=1)
-            if "InvalidRemoteException" in result.stderr:
+            cprint(tail, level=1)
+            if "InvalidRemoteException" in tail:
                 cprint("This error usually means the specified branch doesn't exist.", level=1)
                 cprint("Use --list-branches to see available branches.", level=3)
             return
-        
+
+        _record_known_good_branch(args.frappe_repo, args.frappe_branch)
+
         cprint("Configuring Bench ...", level=2)
-        cprint("Set db_host", level=3)
+
+        # Update common_site_config.json directly in one atomic write.
+        # Every `bench set-config` invocation spawns an interpreter,
+        # re-reads the config, and rewrites the same file, so batching
+        # the keys here saves four redundant subprocess round trips.
         if args.db_type:
             cprint(f"Setting db_type to {args.db_type}", level=3)
-            subprocess.call(
-                ["bench", "set-config", "-g", "db_type", args.db_type],
-                cwd=os.path.join(os.getcwd(), args.bench_name),
-            )
-
         cprint("Set redis_cache to redis://redis-cache:6379", level=3)
-        subprocess.call(
-            [
-                "bench",
-                "set-config",
-                "-g",
-                "redis_cache",
-                "redis://redis-cache:6379",
-            ],
-            cwd=os.path.join(os.getcwd(), args.bench_name),
-        )
         cprint("Set redis_queue to redis://redis-queue:6379", level=3)
-        subprocess.call(
-            [
-                "bench",
-                "set-config",
-                "-g",
-                "redis_queue",
-                "redis://redis-queue:6379",
-            ],
-            cwd=os.path.join(os.getcwd(), args.bench_name),
-        )
         cprint(
             "Set redis_socketio to redis://redis-queue:6379 for backward compatibility",  # noqa: E501
             level=3,
         )
-        subprocess.call(
-            [
-                "bench",
-                "set-config",
-                "-g",
-                "redis_socketio",
-                "redis://redis-queue:6379",
-            ],
-            cwd=os.path.join(os.getcwd(), args.bench_name),
-        )
         cprint("Set developer_mode", level=3)
-        subprocess.call(
-            ["bench", "set-config", "-gp", "developer_mode", "1"],
-            cwd=os.path.join(os.getcwd(), args.bench_name),
+
+        config_path = os.path.join(
+            args.bench_name, "sites", "common_site_config.json"
         )
+        with open(config_path) as f:
+            config = json.load(f)
+        config.update(
+            {
+                "redis_cache": "redis://redis-cache:6379",
+                "redis_queue": "redis://redis-queue:6379",
+                "redis_socketio": "redis://redis-queue:6379",
+                "developer_mode": 1,
+            }
+        )
+        if args.db_type:
+            config["db_type"] = args.db_type
+        tmp_path = config_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(config, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, config_path)
     except subprocess.CalledProcessError as e:
         cprint(f"Error during bench initialization: {e}", level=1)
 
 
 def create_site_in_bench(args):
+    import asyncio
+
+    bench_cwd = os.path.join(os.getcwd(), args.bench_name)
     if args.db_type == "mariadb":
         cprint("Set db_host", level=3)
         subprocess.call(
             ["bench", "set-config", "-g", "db_host", "mariadb"],
-            cwd=os.path.join(os.getcwd(), args.bench_name),
+            cwd=bench_cwd,
         )
         new_site_cmd = [
             "bench",
@@ -305,7 +574,7 @@ def create_site_in_bench(args):
         cprint("Set db_host", level=3)
         subprocess.call(
             ["bench", "set-config", "-g", "db_host", "postgresql"],
-            cwd=os.path.join(os.getcwd(), args.bench_name),
+            cwd=bench_cwd,
         )
         new_site_cmd = [
             "bench",
@@ -317,22 +586,50 @@ def create_site_in_bench(args):
             f"--admin-password={args.admin_password}",
         ]
     
-    apps = os.listdir(f"{os.getcwd()}/{args.bench_name}/apps")
-    apps.remove("frappe")
-    for app in apps:
-        new_site_cmd.append(f"--install-app={app}")
+    # Single scandir pass; filtering inline also avoids the ValueError
+    # that list.remove("frappe") raised when frappe wasn't present.
+    with os.scandir(os.path.join(bench_cwd, "apps")) as entries:
+        apps = [e.name for e in entries if e.is_dir() and e.name != "frappe"]
     new_site_cmd.append(args.site_name)
     cprint(f"Creating Site {args.site_name} ...", level=2)
     subprocess.call(
         new_site_cmd,
-        cwd=os.path.join(os.getcwd(), args.bench_name),
+        cwd=bench_cwd,
     )
 
+    if not apps:
+        return
+
+    # Install the remaining apps as a concurrent fan-out once the bare
+    # site exists; passing them all as --install-app flags made bench
+    # run every install strictly one after another. The semaphore keeps
+    # database contention bounded.
+    async def _install_apps():
+        sem = asyncio.Semaphore(4)
+
+        async def _install(app):
+            async with sem:
+                cprint(f"Installing app {app} ...", level=2)
+                proc = await asyncio.create_subprocess_exec(
+                    "bench",
+                    "--site",
+                    args.site_name,
+                    "install-app",
+                    app,
+                    cwd=bench_cwd,
+                )
+                await proc.wait()
+
+        await asyncio.gather(*[_install(app) for app in apps])
+
+    asyncio.run(_install_apps())
+
 
 if __name__ == "__main__":
     parser = get_args_parser()
     args = parser.parse_args()
-    
+    VERBOSE = args.verbose
+
     # Handle --list-branches option
     if args.list_branches:
         cprint(f"Fetching available branches from {args.frappe_repo}...", level=2)
@@ -340,7 +637,8 @@ if __name__ == "__main__":
         if branches:
             cprint("Available branches:", level=2)
             for branch in sorted(branches):
-                cprint(f"  - {branch}", level=3)
+                # level 2 so the listing shows without --verbose
+                cprint(f"  - {branch}", level=2)
         else:
             cprint("Could not fetch branches. Please check the repository URL.", level=1)
     else: